@@ -7,29 +7,48 @@
 import os
 import re
 import json
+import base64
 import hashlib
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional
-from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from collections import Counter, defaultdict
 import math
 
+try:
+    import orjson  # 可选依赖，用于加速索引读写
+except ImportError:
+    orjson = None
+
 # 默认配置
 DEFAULT_TYPES = ['md', 'txt', 'rst', 'py', 'js', 'ts', 'yaml', 'yml', 'json']
 DEFAULT_EXCLUDE = ['.git', 'node_modules', '__pycache__', '.venv', 'venv', '.cache']
 MAX_FILE_SIZE = 1024 * 1024  # 1MB
+PARALLEL_MIN_FILES = 256  # 文件数少于此值时串行索引，避免进程池启动开销
+STREAMED_KEYS = ('docs', 'inverted')  # 保存索引时逐条写出的大字段
+
+# Bloom filter 参数（每个 token 约 10 位、7 个哈希，误判率约 1%）
+BLOOM_BITS_PER_TOKEN = 10
+BLOOM_HASHES = 7
+BLOOM_MIN_BYTES = 64
+
+# 预编译正则
+_FRONTMATTER_RE = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.+)$')
+_WORD_RE = re.compile(r'[a-zA-Z0-9_]+')
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]+')
 
 
-def get_file_hash(filepath: Path) -> str:
-    """计算文件内容哈希"""
-    with open(filepath, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+def get_content_hash(data: bytes) -> str:
+    """计算文件内容哈希（BLAKE2b）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
 
 
 def extract_frontmatter(content: str) -> Optional[Dict]:
     """提取 YAML frontmatter"""
-    match = re.match(r'^---\s*\n(.*?)\n---\s*\n', content, re.DOTALL)
+    match = _FRONTMATTER_RE.match(content)
     if match:
         fm = {}
         for line in match.group(1).split('\n'):
@@ -44,7 +63,7 @@ def extract_headings(content: str) -> List[Dict]:
     """提取 Markdown 标题"""
     headings = []
     for i, line in enumerate(content.split('\n'), 1):
-        match = re.match(r'^(#{1,6})\s+(.+)$', line)
+        match = _HEADING_RE.match(line)
         if match:
             headings.append({
                 'level': len(match.group(1)),
@@ -57,19 +76,75 @@ def extract_headings(content: str) -> List[Dict]:
 def tokenize(text: str) -> List[str]:
     """简单分词（支持中英文）"""
     # 英文按空格和标点分割
-    words = re.findall(r'[a-zA-Z0-9_]+', text.lower())
+    words = _WORD_RE.findall(text.lower())
     # 中文按字符分割（简单处理）
-    chinese = re.findall(r'[\u4e00-\u9fff]+', text)
-    for c in chinese:
-        words.extend(list(c))
+    words.extend(''.join(_CJK_RE.findall(text)))
     return words
 
 
-def build_inverted_index(docs: Dict) -> Dict:
-    """构建倒排索引"""
+def tokenize_head(content: str, limit: int) -> Tuple[List[str], List[str]]:
+    """一次扫描全文，返回 (前 limit 字符的 tokens, 全文 tokens)"""
+    head, tail = content[:limit].lower(), content[limit:].lower()
+    head_words = _WORD_RE.findall(head)
+    tail_words = _WORD_RE.findall(tail)
+    head_cjk = ''.join(_CJK_RE.findall(head))
+    # 跨越截断位置的单词在全文中是一个完整 token
+    if head_words and tail_words and _WORD_RE.match(head[-1]) and _WORD_RE.match(tail[0]):
+        full_tokens = head_words[:-1]
+        full_tokens.append(head_words[-1] + tail_words[0])
+        full_tokens.extend(tail_words[1:])
+    else:
+        full_tokens = head_words + tail_words
+    full_tokens.extend(head_cjk)
+    full_tokens.extend(''.join(_CJK_RE.findall(tail)))
+    head_words.extend(head_cjk)
+    return head_words, full_tokens
+
+
+def bloom_hash(token: str) -> Tuple[int, int]:
+    """计算 token 的 Bloom 双重哈希值（须与 search.py 保持一致）"""
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little') | 1
+
+
+def build_bloom(tokens: Iterable[str]) -> str:
+    """构建 Bloom filter，返回 base64 编码"""
+    tokens = set(tokens)
+    num_bytes = max(BLOOM_MIN_BYTES, (len(tokens) * BLOOM_BITS_PER_TOKEN + 7) // 8)
+    num_bits = num_bytes * 8
+    bits = bytearray(num_bytes)
+    for token in tokens:
+        h1, h2 = bloom_hash(token)
+        for i in range(BLOOM_HASHES):
+            pos = (h1 + i * h2) % num_bits
+            bits[pos >> 3] |= 1 << (pos & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+
+def get_doc_tokens(doc: Dict) -> List[str]:
+    """获取文档内容 tokens（优先使用 index_file 缓存的结果，旧版索引从 content 分词）"""
+    tokens = doc.get('_tokens')
+    if tokens is None:
+        tokens = tokenize(doc.get('content', ''))
+    return tokens
+
+
+def get_indexed_tokens(index: Dict) -> Dict[str, List[str]]:
+    """从已有索引的倒排表还原每个文档的 tokens（索引不保存 content，增量更新时沿用）"""
+    doc_ids = index.get('doc_ids')
+    doc_tokens = defaultdict(list)
+    for token, posting in index.get('inverted', {}).items():
+        for doc in posting:
+            doc_tokens[doc_ids[doc] if doc_ids is not None else doc].append(token)
+    return doc_tokens
+
+
+def build_inverted_index(docs: Dict) -> Tuple[List[str], Dict[str, List[int]]]:
+    """构建倒排索引（倒排表存储升序文档编号，doc_ids 将编号映射回路径）"""
+    doc_ids = list(docs)
     index = defaultdict(list)
     
-    for filepath, doc in docs.items():
+    for doc_id, (filepath, doc) in enumerate(docs.items()):
         tokens = set()
         
         # 文件名 tokens
@@ -88,48 +163,56 @@ def build_inverted_index(docs: Dict) -> Dict:
                     tokens.update(tokenize(v))
         
         # 内容 tokens (采样以节省空间)
-        content_tokens = tokenize(doc.get('content', ''))
+        content_tokens = get_doc_tokens(doc)
         tokens.update(content_tokens[:500])  # 限制 tokens 数量
         
+        # 增量更新时未变化的文档沿用旧索引中的 tokens
+        tokens.update(doc.get('_indexed_tokens', ()))
+        
         for token in tokens:
             if len(token) >= 2:  # 过滤太短的 token
-                index[token].append(filepath)
+                index[token].append(doc_id)
     
-    return dict(index)
+    return doc_ids, dict(index)
 
 
 def calculate_tf_idf(docs: Dict) -> Dict:
-    """计算 TF-IDF 权重"""
+    """计算 TF-IDF 权重（CSR 稀疏矩阵：第 i 行对应 docs 中第 i 个文档，列号为 token 在 vocab 中的位置）"""
     N = len(docs)
-    doc_freq = defaultdict(int)
-    tf_idf = {}
+    vocab = {}
+    doc_freq = []
     
-    # 计算文档频率
-    for filepath, doc in docs.items():
-        tokens = set(tokenize(doc.get('content', '')))
-        for token in tokens:
-            doc_freq[token] += 1
+    # 每个文档只分词一次，同时统计词频和文档频率
+    per_doc = []
+    for doc in docs.values():
+        tokens = get_doc_tokens(doc)
+        term_freq = Counter(tokens)
+        cols = []
+        for token in term_freq:
+            col = vocab.setdefault(token, len(vocab))
+            if col == len(doc_freq):
+                doc_freq.append(0)
+            doc_freq[col] += 1
+            cols.append(col)
+        per_doc.append((cols, list(term_freq.values()), len(tokens)))
     
-    # 计算 TF-IDF
-    for filepath, doc in docs.items():
-        content = doc.get('content', '')
-        tokens = tokenize(content)
-        token_count = len(tokens)
-        
-        if token_count == 0:
-            continue
-            
-        term_freq = defaultdict(int)
-        for t in tokens:
-            term_freq[t] += 1
-        
-        tf_idf[filepath] = {}
-        for token, count in term_freq.items():
-            tf = count / token_count
-            idf = math.log(N / (1 + doc_freq[token]))
-            tf_idf[filepath][token] = tf * idf
+    # 计算 TF-IDF，按行写入 CSR 数组
+    idf = [math.log(N / (1 + df)) for df in doc_freq]
+    indptr = [0]
+    indices = []
+    data = []
+    for cols, counts, token_count in per_doc:
+        if token_count:
+            indices.extend(cols)
+            data.extend(count / token_count * idf[col] for col, count in zip(cols, counts))
+        indptr.append(len(indices))
     
-    return tf_idf
+    return {
+        'vocab': list(vocab),
+        'indptr': indptr,
+        'indices': indices,
+        'data': data,
+    }
 
 
 def index_file(filepath: Path, base_path: Path) -> Optional[Dict]:
@@ -141,8 +224,12 @@ def index_file(filepath: Path, base_path: Path) -> Optional[Dict]:
         if stat.st_size > MAX_FILE_SIZE:
             return None
         
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
+        # 只读取一次：哈希基于原始字节，再解码为文本
+        raw = filepath.read_bytes()
+        content = raw.decode('utf-8', errors='ignore')
+        if '\r' in content:
+            # 与文本模式读取保持一致，统一换行符
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
         
         rel_path = str(filepath.relative_to(base_path))
         
@@ -150,9 +237,13 @@ def index_file(filepath: Path, base_path: Path) -> Optional[Dict]:
             'path': rel_path,
             'size': stat.st_size,
             'mtime': stat.st_mtime,
-            'hash': get_file_hash(filepath),
-            'content': content[:10000],  # 只存储前 10k 字符
+            'hash': get_content_hash(raw),
         }
+        # 内容 tokens 只在内存中供倒排索引和 TF-IDF 使用，不保存 content（只取前 10k 字符）
+        # 全文 + 文件名 tokens 的 Bloom filter，搜索时用于跳过不可能命中的文件
+        doc['_tokens'], full_tokens = tokenize_head(content, 10000)
+        full_tokens.extend(tokenize(filepath.name))
+        doc['bloom'] = build_bloom(full_tokens)
         
         # Markdown 特殊处理
         if filepath.suffix.lower() == '.md':
@@ -166,19 +257,75 @@ def index_file(filepath: Path, base_path: Path) -> Optional[Dict]:
         return None
 
 
-def should_include(filepath: Path, include_types: List[str], exclude_patterns: List[str]) -> bool:
-    """检查文件是否应被索引"""
-    # 检查文件类型
-    if filepath.suffix.lstrip('.').lower() not in include_types:
-        return False
+def _process_file(args: Tuple[Path, Path, Optional[float]]) -> Tuple[str, bool, Optional[Dict]]:
+    """处理单个文件（可在工作进程中执行），返回 (相对路径, 是否重新索引, 文档)"""
+    filepath, base_path, existing_mtime = args
+    rel_path = str(filepath.relative_to(base_path))
     
-    # 检查排除模式
-    path_str = str(filepath)
-    for pattern in exclude_patterns:
-        if pattern in path_str:
-            return False
+    # 检查是否需要更新
+    if existing_mtime is not None and filepath.stat().st_mtime <= existing_mtime:
+        return rel_path, False, None
     
-    return True
+    return rel_path, True, index_file(filepath, base_path)
+
+
+def load_index(index_path: str) -> Dict:
+    """读取索引文件"""
+    data = Path(index_path).read_bytes()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(obj) -> bytes:
+    """序列化为紧凑 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def save_index(index: Dict, output_path: str):
+    """保存索引文件（紧凑格式；docs、inverted 逐条写出，避免一次性序列化整个索引的内存峰值）"""
+    with open(output_path, 'wb') as f:
+        f.write(b'{')
+        for i, (key, value) in enumerate(index.items()):
+            if i:
+                f.write(b',')
+            f.write(_dumps(key) + b':')
+            
+            if key not in STREAMED_KEYS:
+                f.write(_dumps(value))
+                continue
+            
+            f.write(b'{')
+            for j, (k, v) in enumerate(value.items()):
+                f.write((b',' if j else b'') + _dumps(k) + b':' + _dumps(v))
+            f.write(b'}')
+        f.write(b'}')
+
+
+def iter_files(root: Path, include_types: List[str], exclude_patterns: List[str]) -> Iterator[Path]:
+    """遍历需要索引的文件（基于 os.scandir，命中排除模式的目录不再向下遍历）"""
+    types = frozenset(include_types)
+    stack = [str(root)]
+    
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    path = entry.path
+                    # 检查排除模式
+                    if any(pattern in path for pattern in exclude_patterns):
+                        continue
+                    
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(path)
+                    elif entry.is_file():
+                        # 检查文件类型
+                        if os.path.splitext(entry.name)[1][1:].lower() in types:
+                            yield Path(path)
+        except OSError:
+            continue
 
 
 def build_index(
@@ -186,10 +333,14 @@ def build_index(
     output_path: str = None,
     types: List[str] = None,
     exclude: List[str] = None,
-    incremental: bool = True
+    incremental: bool = True,
+    workers: int = None
 ) -> Dict:
     """构建文档索引"""
     
+    if workers is not None and workers < 1:
+        raise ValueError("workers must be at least 1")
+    
     root = Path(root_path).resolve()
     types = types or DEFAULT_TYPES
     exclude = exclude or DEFAULT_EXCLUDE
@@ -197,47 +348,59 @@ def build_index(
     # 加载已有索引（增量更新）
     existing_index = {}
     if incremental and output_path and Path(output_path).exists():
-        with open(output_path, 'r') as f:
-            existing_index = json.load(f)
+        existing_index = load_index(output_path)
     
     existing_docs = existing_index.get('docs', {})
+    existing_tokens = get_indexed_tokens(existing_index) if existing_docs else {}
     
     # 扫描文件
     docs = {}
-    file_count = 0
     updated_count = 0
     
-    for filepath in root.rglob('*'):
-        if not filepath.is_file():
-            continue
-        
-        if not should_include(filepath, types, exclude):
-            continue
-        
-        rel_path = str(filepath.relative_to(root))
-        file_count += 1
-        
-        # 检查是否需要更新
-        if rel_path in existing_docs:
-            existing = existing_docs[rel_path]
-            if filepath.stat().st_mtime <= existing.get('mtime', 0):
-                docs[rel_path] = existing
-                continue
-        
-        # 索引文件
-        doc = index_file(filepath, root)
-        if doc:
-            docs[rel_path] = doc
-            updated_count += 1
+    worklist = []
+    for filepath in iter_files(root, types, exclude):
+        existing = existing_docs.get(str(filepath.relative_to(root)))
+        # 旧版索引中没有 Bloom filter 的文档需要重新索引
+        existing_mtime = existing.get('mtime', 0) if existing is not None and 'bloom' in existing else None
+        worklist.append((filepath, root, existing_mtime))
+    
+    file_count = len(worklist)
+    
+    # 索引文件（文件较多时多进程并行）
+    executor = None
+    if (workers or os.cpu_count() or 1) == 1 or file_count < PARALLEL_MIN_FILES:
+        processed = map(_process_file, worklist)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        processed = executor.map(_process_file, worklist, chunksize=64)
+    
+    try:
+        for rel_path, changed, doc in processed:
+            if not changed:
+                doc = existing_docs[rel_path]
+                doc['_indexed_tokens'] = existing_tokens.get(rel_path, [])
+                docs[rel_path] = doc
+            elif doc:
+                docs[rel_path] = doc
+                updated_count += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
     
     # 构建倒排索引
-    inverted = build_inverted_index(docs)
+    doc_ids, inverted = build_inverted_index(docs)
     
     # 构建 TF-IDF（可选）
     # tf_idf = calculate_tf_idf(docs)
     
+    # 移除仅在内存中使用的字段（旧版索引中的 content 也一并移除）
+    for doc in docs.values():
+        doc.pop('_tokens', None)
+        doc.pop('_indexed_tokens', None)
+        doc.pop('content', None)
+    
     index = {
-        'version': '1.0',
+        'version': '1.2',
         'root': str(root),
         'created': datetime.now().isoformat(),
         'stats': {
@@ -246,14 +409,14 @@ def build_index(
             'updated_files': updated_count
         },
         'docs': docs,
+        'doc_ids': doc_ids,
         'inverted': inverted,
         # 'tf_idf': tf_idf  # 可选，会增加索引大小
     }
     
     # 保存索引
     if output_path:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        save_index(index, output_path)
         print(f"Index saved to {output_path}")
     
     print(f"Indexed {len(docs)} files ({updated_count} updated)")
@@ -268,9 +431,13 @@ def main():
     parser.add_argument('--types', '-t', help='File types to index (comma-separated)')
     parser.add_argument('--exclude', '-e', help='Patterns to exclude (comma-separated)')
     parser.add_argument('--full', action='store_true', help='Full rebuild (ignore existing index)')
+    parser.add_argument('--workers', '-j', type=int, help='Worker processes (default: CPU count)')
     
     args = parser.parse_args()
     
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
     types = args.types.split(',') if args.types else None
     exclude = args.exclude.split(',') if args.exclude else None
     
@@ -279,7 +446,8 @@ def main():
         output_path=args.output,
         types=types,
         exclude=exclude,
-        incremental=not args.full
+        incremental=not args.full,
+        workers=args.workers
     )
 
 
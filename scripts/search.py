@@ -6,13 +6,23 @@
 
 import os
 import re
+import mmap
+import threading
 import json
+import base64
+import hashlib
 import argparse
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass, asdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Pattern, Tuple
+from dataclasses import dataclass
 from collections import defaultdict
 
+try:
+    import orjson  # 可选依赖，用于加速索引读取和 JSON 输出
+except ImportError:
+    orjson = None
+
 # 搜索权重
 WEIGHTS = {
     'filename_exact': 100,
@@ -25,6 +35,15 @@ WEIGHTS = {
 
 DEFAULT_TYPES = ['md', 'txt', 'rst', 'py', 'js', 'ts', 'yaml', 'yml', 'json']
 DEFAULT_EXCLUDE = ['.git', 'node_modules', '__pycache__', '.venv', 'venv']
+MMAP_MIN_SIZE = 64 * 1024  # 不小于此大小的文件预检时使用 mmap
+LOWER_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 小写内容缓存上限
+BLOOM_HASHES = 7  # 须与 indexer.py 保持一致
+
+# 预编译正则
+_FRONTMATTER_RE = re.compile(r'^---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+_HEAD_PREFIX_RE = re.compile(r'^(#{1,6})\s+')
+_WORD_RE = re.compile(r'[a-zA-Z0-9_]+')
+_CJK_RE = re.compile(r'[\u4e00-\u9fff]+')
 
 
 @dataclass
@@ -34,6 +53,15 @@ class Match:
     line: int
     content: str
     context: List[str]
+    
+    def to_dict(self) -> Dict:
+        """转换为字典（避免 dataclasses.asdict 的递归深拷贝）"""
+        return {
+            'type': self.type,
+            'line': self.line,
+            'content': self.content,
+            'context': self.context,
+        }
 
 
 @dataclass
@@ -42,14 +70,20 @@ class SearchResult:
     file: str
     score: int
     matches: List[Match]
+    
+    def to_dict(self) -> Dict:
+        """转换为字典（避免 dataclasses.asdict 的递归深拷贝）"""
+        return {
+            'file': self.file,
+            'score': self.score,
+            'matches': [m.to_dict() for m in self.matches],
+        }
 
 
 def tokenize(text: str) -> List[str]:
     """简单分词"""
-    words = re.findall(r'[a-zA-Z0-9_]+', text.lower())
-    chinese = re.findall(r'[\u4e00-\u9fff]+', text)
-    for c in chinese:
-        words.extend(list(c))
+    words = _WORD_RE.findall(text.lower())
+    words.extend(''.join(_CJK_RE.findall(text)))
     return words
 
 
@@ -60,6 +94,61 @@ def normalize_query(query: str) -> Tuple[str, List[str]]:
     return query_lower, tokens
 
 
+def bloom_tokens(query: str) -> List[str]:
+    """查询词出现在文件中时必然作为完整 token 出现的部分（用于 Bloom filter 检查）"""
+    # 中文单字总是完整 token；首尾的英文词可能只是文件中更长单词的一部分，只取中间的词
+    text = query.lower()
+    tokens = [m.group() for m in _WORD_RE.finditer(text) if m.start() > 0 and m.end() < len(text)]
+    tokens.extend(''.join(_CJK_RE.findall(text)))
+    return tokens
+
+
+def bloom_hash(token: str) -> Tuple[int, int]:
+    """计算 token 的 Bloom 双重哈希值（须与 indexer.py 保持一致）"""
+    digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest[:4], 'little'), int.from_bytes(digest[4:], 'little') | 1
+
+
+def bloom_contains(bloom: str, token_hashes: List[Tuple[int, int]]) -> bool:
+    """Bloom filter 是否可能包含全部 tokens（token_hashes 每个查询只需计算一次）"""
+    bits = base64.b64decode(bloom)
+    num_bits = len(bits) * 8
+    for h1, h2 in token_hashes:
+        for i in range(BLOOM_HASHES):
+            pos = (h1 + i * h2) % num_bits
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+    return True
+
+
+def compile_query(query: str) -> Pattern:
+    """编译查询正则（字面匹配，忽略大小写）"""
+    return re.compile(re.escape(query), re.IGNORECASE)
+
+
+def is_bytes_searchable(query_lower: str) -> bool:
+    """查询词可否直接在 bytes.lower() 结果中查找（非 ASCII 字符须无大小写之分，如中文）"""
+    return query_lower.isascii() or all(c.isascii() or c.upper() == c for c in query_lower)
+
+
+def iter_heading_starts(content: str) -> Iterator[int]:
+    """定位所有以 # 开头的行的起始偏移（str.find 在 C 层扫描，无需逐行遍历）"""
+    if content.startswith('#'):
+        yield 0
+    pos = content.find('\n#')
+    while pos != -1:
+        yield pos + 1
+        pos = content.find('\n#', pos + 1)
+
+
+def is_modified(filepath: Path, doc: Dict) -> bool:
+    """文件是否在建立索引后被修改过"""
+    try:
+        return filepath.stat().st_mtime > doc.get('mtime', 0)
+    except OSError:
+        return False
+
+
 def get_context_lines(lines: List[str], line_num: int, context: int = 2) -> List[str]:
     """获取上下文行"""
     start = max(0, line_num - context - 1)
@@ -75,49 +164,140 @@ class DocSearch:
         path: str = None,
         index_path: str = None,
         types: List[str] = None,
-        exclude: List[str] = None
+        exclude: List[str] = None,
+        workers: int = None,
+        cache_lower: bool = False
     ):
         self.path = Path(path).resolve() if path else None
         self.types = types or DEFAULT_TYPES
         self.exclude = exclude or DEFAULT_EXCLUDE
+        self.workers = workers
         self.index = None
         
+        # 文件小写内容缓存（可选）：路径 -> ((mtime_ns, size), 小写字节)，供同一实例的重复搜索复用
+        self._lower_cache: Optional[Dict[str, Tuple[Tuple[int, int], bytes]]] = {} if cache_lower else None
+        self._lower_cache_bytes = 0
+        self._lower_cache_lock = threading.Lock()
+        
         if index_path and Path(index_path).exists():
-            with open(index_path, 'r') as f:
-                self.index = json.load(f)
+            data = Path(index_path).read_bytes()
+            self.index = orjson.loads(data) if orjson is not None else json.loads(data)
             self.path = Path(self.index.get('root', path or '.'))
     
-    def should_include(self, filepath: Path) -> bool:
-        """检查文件是否应被搜索"""
-        if filepath.suffix.lstrip('.').lower() not in self.types:
-            return False
-        path_str = str(filepath)
-        for pattern in self.exclude:
-            if pattern in path_str:
-                return False
-        return True
+    def iter_files(self) -> Iterator[Path]:
+        """遍历需要搜索的文件（基于 os.scandir，命中排除模式的目录不再向下遍历）"""
+        types = frozenset(self.types)
+        stack = [str(self.path)]
+        
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        path = entry.path
+                        if any(pattern in path for pattern in self.exclude):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(path)
+                        elif entry.is_file():
+                            if os.path.splitext(entry.name)[1][1:].lower() in types:
+                                yield Path(path)
+            except OSError:
+                continue
+    
+    def read_if_contains(self, filepath: Path, query_lower: str) -> Optional[bytes]:
+        """读取文件内容；字节层面（忽略 ASCII 大小写）不包含查询词时返回 None"""
+        query_bytes = query_lower.encode('utf-8')
+        key = str(filepath)
+        try:
+            f = open(filepath, 'rb')
+        except OSError:
+            # 文件已删除或不可读时一并移除缓存项
+            if self._lower_cache is not None:
+                self.evict_lower_cache([key])
+            raise
+        
+        with f:
+            stat = os.fstat(f.fileno())
+            
+            # 查询词无大小写之分时（如中文、数字），大文件用 mmap 直接查找，未命中则无需读入内存
+            if query_lower.upper() == query_lower and stat.st_size >= MMAP_MIN_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if mm.find(query_bytes) == -1:
+                        return None
+                return f.read()
+            
+            # 缓存命中且文件未变化时，未命中查询词的文件无需再次读取
+            if self._lower_cache is not None:
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                cached = self._lower_cache.get(key)
+                if cached is not None and cached[0] == stamp:
+                    if query_bytes not in cached[1]:
+                        return None
+                    return f.read()
+            
+            raw = f.read()
+        
+        raw_lower = raw.lower()
+        
+        # 缓存达到上限后不再加入新文件（顺序扫描时 LRU 淘汰会使缓存完全失效）
+        if self._lower_cache is not None:
+            with self._lower_cache_lock:
+                old_size = len(cached[1]) if cached is not None else 0
+                if self._lower_cache_bytes - old_size + len(raw_lower) <= LOWER_CACHE_MAX_BYTES:
+                    self._lower_cache[key] = (stamp, raw_lower)
+                    self._lower_cache_bytes += len(raw_lower) - old_size
+        
+        if query_bytes not in raw_lower:
+            return None
+        return raw
+    
+    def evict_lower_cache(self, keys: Iterable[str]) -> None:
+        """从小写内容缓存中移除指定文件"""
+        with self._lower_cache_lock:
+            for key in keys:
+                entry = self._lower_cache.pop(key, None)
+                if entry is not None:
+                    self._lower_cache_bytes -= len(entry[1])
     
     def search_in_file(
         self,
         filepath: Path,
         query: str,
         query_tokens: List[str],
-        context_lines: int = 2
+        context_lines: int = 2,
+        query_re: Optional[Pattern] = None
     ) -> Optional[SearchResult]:
         """在单个文件中搜索"""
         
+        filename = filepath.name.lower()
+        stem = filepath.stem.lower()
+        query_lower = query.lower()
+        
+        # 快速预检：文件名和内容都不包含查询词时直接跳过，无需解码和逐行扫描
+        check_content = query_lower not in filename
+        bytes_searchable = is_bytes_searchable(query_lower)
         try:
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+            if check_content and bytes_searchable:
+                raw = self.read_if_contains(filepath, query_lower)
+                if raw is None:
+                    return None
+            else:
+                raw = filepath.read_bytes()
         except Exception:
             return None
         
+        content = raw.decode('utf-8', errors='ignore')
+        if '\r' in content:
+            # 与文本模式读取保持一致，统一换行符
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        
+        # 无法在字节层面预检的查询词（含非 ASCII 大小写字母），解码后对全文转一次小写再检查
+        if check_content and not bytes_searchable and query_lower not in content.lower():
+            return None
+        
         lines = content.split('\n')
         matches = []
         score = 0
-        filename = filepath.name.lower()
-        stem = filepath.stem.lower()
-        query_lower = query.lower()
         
         # 1. 文件名匹配
         if query_lower == stem:
@@ -140,7 +320,7 @@ class DocSearch:
         # 2. Markdown 特殊处理
         if filepath.suffix.lower() == '.md':
             # Frontmatter 匹配
-            fm_match = re.match(r'^---\s*\n(.*?)\n---\s*\n', content, re.DOTALL)
+            fm_match = _FRONTMATTER_RE.match(content)
             if fm_match:
                 fm_content = fm_match.group(1).lower()
                 if query_lower in fm_content:
@@ -156,11 +336,17 @@ class DocSearch:
                             ))
                             break
             
-            # 标题匹配
-            for i, line in enumerate(lines, 1):
-                if re.match(r'^#{1,6}\s+', line):
+            # 标题匹配（只检查以 # 开头的行，按换行符计数得到行号）
+            i = 1
+            pos = 0
+            for start in iter_heading_starts(content):
+                i += content.count('\n', pos, start)
+                pos = start
+                line = lines[i - 1]
+                head_match = _HEAD_PREFIX_RE.match(line)
+                if head_match:
                     if query_lower in line.lower():
-                        level = len(re.match(r'^(#+)', line).group(1))
+                        level = len(head_match.group(1))
                         weight = WEIGHTS['heading'] if level > 1 else WEIGHTS['title']
                         score += weight
                         matches.append(Match(
@@ -170,22 +356,32 @@ class DocSearch:
                             context=get_context_lines(lines, i, context_lines)
                         ))
         
-        # 3. 正文内容匹配
+        # 3. 正文内容匹配（对整个内容做一次正则扫描，按换行符计数得到行号）
+        if query_re is None:
+            query_re = compile_query(query)
+        matched_lines = {m.line for m in matches}
         content_matches = 0
-        for i, line in enumerate(lines, 1):
-            if query_lower in line.lower():
-                # 跳过已经作为标题/frontmatter 匹配的
-                if any(m.line == i for m in matches):
-                    continue
-                
-                content_matches += 1
-                if content_matches <= 5:  # 限制内容匹配数量
-                    matches.append(Match(
-                        type='content',
-                        line=i,
-                        content=line.strip(),
-                        context=get_context_lines(lines, i, context_lines)
-                    ))
+        line_num = 1
+        pos = 0
+        for match in query_re.finditer(content):
+            start = match.start()
+            line_num += content.count('\n', pos, start)
+            pos = start
+            # 跳过已经作为标题/frontmatter 匹配的，以及同一行内的重复命中
+            if line_num in matched_lines:
+                continue
+            matched_lines.add(line_num)
+            
+            content_matches += 1
+            line = lines[line_num - 1]
+            matches.append(Match(
+                type='content',
+                line=line_num,
+                content=line.strip(),
+                context=get_context_lines(lines, line_num, context_lines)
+            ))
+            if content_matches >= 5:  # 限制内容匹配数量（计分最多只算 3 次）
+                break
         
         if content_matches > 0:
             # 内容匹配分数，多次匹配有加成但递减
@@ -202,6 +398,24 @@ class DocSearch:
             matches=matches
         )
     
+    def search_files(
+        self,
+        filepaths: Iterable[Path],
+        query: str,
+        query_tokens: List[str],
+        context_lines: int = 2,
+        query_re: Optional[Pattern] = None
+    ) -> List[SearchResult]:
+        """并发搜索多个文件（线程池重叠文件读取的等待时间）"""
+        
+        def search_one(filepath: Path) -> Optional[SearchResult]:
+            return self.search_in_file(
+                filepath, query, query_tokens, context_lines, query_re
+            )
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return [r for r in executor.map(search_one, filepaths) if r]
+    
     def search_with_index(
         self,
         query: str,
@@ -214,8 +428,9 @@ class DocSearch:
             raise ValueError("No index loaded")
         
         query_lower, query_tokens = normalize_query(query)
+        query_re = compile_query(query)
         
-        # 从倒排索引找候选文件
+        # 从倒排索引找候选文件（取并集；查询是子串匹配且倒排表只采样文件开头，不能取交集）
         candidates = set()
         inverted = self.index.get('inverted', {})
         
@@ -223,26 +438,34 @@ class DocSearch:
             if token in inverted:
                 candidates.update(inverted[token])
         
+        # 1.1 起倒排表存储文档编号，需映射回路径；旧索引直接存储路径
+        doc_ids = self.index.get('doc_ids')
+        if doc_ids is not None:
+            candidates = {doc_ids[i] for i in candidates}
+        
         # 如果没有通过 tokens 找到，回退到全部文件
         if not candidates:
             candidates = set(self.index.get('docs', {}).keys())
         
-        results = []
         docs = self.index.get('docs', {})
-        
+        required_hashes = [bloom_hash(token) for token in bloom_tokens(query)]
+        filepaths = []
         for filepath in candidates:
-            if filepath not in docs:
+            doc = docs.get(filepath)
+            if doc is None:
                 continue
             
-            doc = docs[filepath]
             full_path = self.path / filepath
-            
-            if full_path.exists():
-                result = self.search_in_file(
-                    full_path, query, query_tokens, context_lines
-                )
-                if result:
-                    results.append(result)
+            # Bloom filter 确认不包含的文件直接跳过（文件在索引后修改过则仍需搜索）
+            if required_hashes and 'bloom' in doc:
+                if not bloom_contains(doc['bloom'], required_hashes) and not is_modified(full_path, doc):
+                    continue
+            filepaths.append(full_path)
+        
+        # 文件不存在时 search_in_file 读取失败返回 None，无需预先 exists()
+        results = self.search_files(
+            filepaths, query, query_tokens, context_lines, query_re
+        )
         
         # 按分数排序
         results.sort(key=lambda r: r.score, reverse=True)
@@ -261,20 +484,15 @@ class DocSearch:
             raise ValueError("No search path specified")
         
         query_lower, query_tokens = normalize_query(query)
-        results = []
-        
-        for filepath in self.path.rglob('*'):
-            if not filepath.is_file():
-                continue
-            
-            if not self.should_include(filepath):
-                continue
-            
-            result = self.search_in_file(
-                filepath, query, query_tokens, context_lines
-            )
-            if result:
-                results.append(result)
+        query_re = compile_query(query)
+        filepaths = self.iter_files()
+        if self._lower_cache is not None:
+            # 遍历结果覆盖全部文件，顺带移除已删除文件的缓存项
+            filepaths = list(filepaths)
+            self.evict_lower_cache(self._lower_cache.keys() - {str(p) for p in filepaths})
+        results = self.search_files(
+            filepaths, query, query_tokens, context_lines, query_re
+        )
         
         # 按分数排序
         results.sort(key=lambda r: r.score, reverse=True)
@@ -299,9 +517,13 @@ def format_results(results: List[SearchResult], output_format: str = 'json') ->
     """格式化输出"""
     
     if output_format == 'json':
+        if orjson is not None:
+            # orjson 原生支持序列化 dataclass
+            output = {'total': len(results), 'results': results}
+            return orjson.dumps(output, option=orjson.OPT_INDENT_2).decode('utf-8')
         output = {
             'total': len(results),
-            'results': [asdict(r) for r in results]
+            'results': [r.to_dict() for r in results]
         }
         return json.dumps(output, ensure_ascii=False, indent=2)
     
@@ -329,18 +551,23 @@ def main():
     parser.add_argument('--types', '-t', help='File types (comma-separated)')
     parser.add_argument('--format', '-f', choices=['json', 'simple', 'files'], 
                         default='simple', help='Output format')
+    parser.add_argument('--workers', '-j', type=int, help='Threads used to read and search files')
     
     args = parser.parse_args()
     
     if not args.path and not args.index:
         parser.error("Either path or --index must be specified")
     
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    
     types = args.types.split(',') if args.types else None
     
     searcher = DocSearch(
         path=args.path,
         index_path=args.index,
-        types=types
+        types=types,
+        workers=args.workers
     )
     
     results = searcher.search(